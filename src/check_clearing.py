@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import argparse
+
+import numpy as np
+
+from src.clearing import Offers, clear
+from src.drawing_utils import Point
+from src.supply_demand import DX, DemandCurve, SupplyCurve, SupplyDemand
+
+DEFAULT_N_RANDOM = 300
+DEFAULT_SEED = 0
+
+
+def notebook_markets() -> dict[str, SupplyDemand]:
+    x_vals = np.linspace(0, 10)
+    return {
+        "linear": SupplyDemand(
+            [SupplyCurve([Point(x, 1 + 1 * x) for x in x_vals], stepped=False)],
+            [DemandCurve([Point(x, 10 - x) for x in x_vals], stepped=False)],
+        ),
+        "one generator, one load": SupplyDemand(
+            [SupplyCurve([Point(0, 0), Point(6, 2), Point(9, 7)])],
+            [DemandCurve([Point(0, 8), Point(4, 8), Point(8, 5)])],
+        ),
+        "two generators, two loads": SupplyDemand(
+            [
+                SupplyCurve([Point(0, 0), Point(6, 2), Point(9, 7)], "G1"),
+                SupplyCurve([Point(0, 0), Point(7, 4), Point(10, 10)], "G2"),
+            ],
+            [
+                DemandCurve([Point(0, 8), Point(4, 8), Point(8, 5)], "L1"),
+                DemandCurve([Point(0, 9), Point(3, 9), Point(9, 3)], "L2"),
+            ],
+        ),
+    }
+
+
+def redundant_markets() -> dict[str, tuple[SupplyDemand, bool]]:
+    return {
+        "linear, collinear points": (notebook_markets()["linear"], True),
+        "stepped, equal prices and zero-width steps": (
+            SupplyDemand(
+                [
+                    SupplyCurve(
+                        [
+                            Point(0, 0),
+                            Point(3, 2),
+                            Point(6, 2),
+                            Point(6, 6),
+                            Point(9, 7),
+                        ],
+                        "G1",
+                    ),
+                    SupplyCurve(
+                        [
+                            Point(0, 0),
+                            Point(2, 4),
+                            Point(4, 4),
+                            Point(7, 4),
+                            Point(10, 10),
+                        ],
+                        "G2",
+                    ),
+                ],
+                [
+                    DemandCurve(
+                        [Point(0, 8), Point(2, 8), Point(4, 8), Point(8, 5)], "L1"
+                    ),
+                    DemandCurve(
+                        [Point(0, 9), Point(3, 9), Point(3, 9), Point(9, 3)], "L2"
+                    ),
+                ],
+            ),
+            True,
+        ),
+        "two linear generators": (
+            SupplyDemand(
+                [
+                    SupplyCurve(
+                        [Point(0, 0), Point(5, 5), Point(10, 10)], "G1", stepped=False
+                    ),
+                    SupplyCurve([Point(0, 0), Point(10, 7)], "G2", stepped=False),
+                ],
+                [DemandCurve([Point(0, 12), Point(20, 0)], "L1", stepped=False)],
+            ),
+            False,
+        ),
+    }
+
+
+def random_market(rng: np.random.Generator, stepped: bool) -> SupplyDemand:
+    def curves[C: SupplyCurve | DemandCurve](curve_type: type[C]) -> list[C]:
+        curves = []
+        for i in range(rng.integers(1, 4)):
+            n_points = rng.integers(2, 7)
+            xs = np.concatenate([[0.0], np.cumsum(rng.integers(1, 7, n_points - 1))])
+            ys = np.sort(rng.integers(0, 21, n_points)).astype(float)
+            if curve_type is DemandCurve:
+                ys = ys[::-1]
+            curves.append(
+                curve_type(
+                    [Point(x / 2, y / 2) for x, y in zip(xs, ys, strict=True)],
+                    f"{curve_type.name} {i + 1}",
+                    stepped=stepped,
+                )
+            )
+        return curves
+
+    return SupplyDemand(curves(SupplyCurve), curves(DemandCurve))
+
+
+def cleared(supply_demand: SupplyDemand) -> tuple[float, float]:
+    [stepped] = {c.stepped for c in supply_demand.curves}
+    quantities, prices = clear(
+        Offers.from_curves(supply_demand.supply_curves),
+        Offers.from_curves(supply_demand.demand_curves),
+        stepped,
+    )
+    return float(quantities[0]), float(prices[0])
+
+
+def welfare_gap(supply_demand: SupplyDemand) -> tuple[float, float, float]:
+    clearing = supply_demand.cleared()
+    welfare = clearing.welfare()
+    equilibrium_quantity = float(clearing.equilibrium_quantity())
+    quantity, _ = cleared(supply_demand)
+    return (
+        equilibrium_quantity,
+        quantity,
+        float(welfare(equilibrium_quantity) - welfare(quantity)),
+    )
+
+
+def check_clearing(
+    n_random: int = DEFAULT_N_RANDOM, seed: int = DEFAULT_SEED
+) -> list[str]:
+    mismatches = []
+    for name, supply_demand in notebook_markets().items():
+        equilibrium_quantity, quantity, gap = welfare_gap(supply_demand)
+        print(
+            f"{name}: Q_opt = {equilibrium_quantity:.3f}, cleared Q = {quantity:.3f}, "
+            f"W(Q_opt) - W(Q) = {gap:.6f}"
+        )
+        if abs(gap) > DX:
+            mismatches.append(name)
+
+    rng = np.random.default_rng(seed)
+    n_agree = 0
+    for i in range(n_random):
+        stepped = bool(i % 2)
+        equilibrium_quantity, quantity, gap = welfare_gap(random_market(rng, stepped))
+        if abs(gap) > DX:
+            mismatches.append(
+                f"random market {i} ({'stepped' if stepped else 'linear'}): "
+                f"Q_opt = {equilibrium_quantity:.3f}, cleared Q = {quantity:.3f}, "
+                f"W(Q_opt) - W(Q) = {gap:.6f}"
+            )
+        else:
+            n_agree += 1
+    print(f"{n_agree}/{n_random} random markets clear at the optimal welfare")
+    return mismatches
+
+
+def check_simplification() -> list[str]:
+    mismatches = []
+    for name, (supply_demand, reducible) in redundant_markets().items():
+        simplified, simplification = supply_demand.simplified()
+        [stepped] = {c.stepped for c in supply_demand.curves}
+        equilibrium_quantity, quantity, _ = welfare_gap(supply_demand)
+        simplified_equilibrium_quantity, simplified_quantity, _ = welfare_gap(
+            simplified
+        )
+        print(
+            f"{name}: {simplification.n_points} -> "
+            f"{simplification.n_simplified_points} points, "
+            f"Q_opt = {equilibrium_quantity:.3f} -> "
+            f"{simplified_equilibrium_quantity:.3f}, "
+            f"cleared Q = {quantity:.3f} -> {simplified_quantity:.3f}"
+        )
+        if reducible != (simplification.reduction > 0):
+            mismatches.append(f"{name}: {simplification}")
+        welfare = supply_demand.welfare()
+        if (
+            abs(
+                welfare(equilibrium_quantity) - welfare(simplified_equilibrium_quantity)
+            )
+            > DX
+            or (stepped and equilibrium_quantity != simplified_equilibrium_quantity)
+            or not np.isclose(quantity, simplified_quantity)
+            or not np.isclose(
+                cleared(supply_demand)[1], cleared(simplified)[1], equal_nan=True
+            )
+        ):
+            mismatches.append(name)
+        if stepped:
+            mismatches += [
+                f"{name}: {curve.name} dispatch"
+                for curve in supply_demand.curves
+                if supply_demand.equilibrium_quantity(curve.name)
+                != simplified.equilibrium_quantity(curve.name)
+            ]
+    return mismatches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Check that vectorized breakpoint clearing reaches the welfare "
+            "found by the grid search on the notebook and random markets, and "
+            "that simplifying offer curves leaves clearing results unchanged"
+        )
+    )
+    parser.add_argument(
+        "--n-random",
+        type=int,
+        default=DEFAULT_N_RANDOM,
+        help=f"Number of random markets (default: {DEFAULT_N_RANDOM})",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=DEFAULT_SEED, help=f"Seed (default: {DEFAULT_SEED})"
+    )
+
+    args = parser.parse_args()
+
+    if mismatches := check_clearing(args.n_random, args.seed) + check_simplification():
+        raise SystemExit("Clearing mismatches:\n" + "\n".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
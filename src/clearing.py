@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import dataclasses
+from typing import Self
+
+import numpy as np
+
+from src.supply_demand import DemandCurve, SupplyCurve
+
+MAX_ELEMENTS = 2**24
+
+
+@dataclasses.dataclass
+class Offers:
+    curve_type: type[SupplyCurve | DemandCurve]
+    widths: np.ndarray
+    prices: np.ndarray
+    zero_quantity_prices: np.ndarray
+
+    @classmethod
+    def from_breakpoints(
+        cls,
+        curve_type: type[SupplyCurve | DemandCurve],
+        xs: np.ndarray,
+        ys: np.ndarray,
+        n_rows: int = 1,
+    ) -> Self:
+        return cls(
+            curve_type,
+            np.tile(np.diff(xs), (n_rows, 1)),
+            np.tile(ys[1:], (n_rows, 1)),
+            np.full(n_rows, ys[0]),
+        )
+
+    @classmethod
+    def from_curve(cls, curve: SupplyCurve | DemandCurve, n_rows: int = 1) -> Self:
+        return cls.from_breakpoints(type(curve), curve.xs, curve.ys, n_rows)
+
+    @classmethod
+    def from_curves(
+        cls, curves: list[SupplyCurve] | list[DemandCurve], n_rows: int = 1
+    ) -> Self:
+        return cls.combined([cls.from_curve(c, n_rows) for c in curves])
+
+    @classmethod
+    def combined(cls, offers: list[Offers]) -> Self:
+        [curve_type] = {o.curve_type for o in offers}
+        return cls(
+            curve_type,
+            np.concatenate([o.widths for o in offers], axis=1),
+            np.concatenate([o.prices for o in offers], axis=1),
+            {SupplyCurve: np.min, DemandCurve: np.max}[curve_type](
+                [o.zero_quantity_prices for o in offers], axis=0
+            ),
+        )
+
+    @property
+    def n_rows(self) -> int:
+        return self.widths.shape[0]
+
+    @property
+    def n_segments(self) -> int:
+        return self.widths.shape[1]
+
+    def __getitem__(self, rows: slice) -> Self:
+        return dataclasses.replace(
+            self,
+            widths=self.widths[rows],
+            prices=self.prices[rows],
+            zero_quantity_prices=self.zero_quantity_prices[rows],
+        )
+
+    def perturbed(
+        self, price_offsets: np.ndarray, quantity_factors: np.ndarray
+    ) -> Self:
+        return dataclasses.replace(
+            self,
+            widths=(self.widths * quantity_factors[:, np.newaxis]),
+            prices=(self.prices + price_offsets[:, np.newaxis]),
+            zero_quantity_prices=(self.zero_quantity_prices + price_offsets),
+        )
+
+    def aggregated(self) -> tuple[np.ndarray, np.ndarray]:
+        order = np.argsort(
+            self.prices if self.curve_type is SupplyCurve else -self.prices,
+            axis=1,
+            kind="stable",
+        )
+        widths = np.take_along_axis(self.widths, order, axis=1)
+        prices = np.take_along_axis(self.prices, order, axis=1)
+        xs = np.concatenate(
+            [np.zeros((self.n_rows, 1)), np.cumsum(widths, axis=1)], axis=1
+        )
+        ys = np.concatenate([self.zero_quantity_prices[:, np.newaxis], prices], axis=1)
+        return xs, ys
+
+
+def rows_per_chunk(
+    supply: Offers, demand: Offers, max_elements: int = MAX_ELEMENTS
+) -> int:
+    n_candidates = supply.n_segments + demand.n_segments + 2
+    n_points = max(supply.n_segments, demand.n_segments) + 1
+    return max(1, max_elements // (n_candidates * n_points))
+
+
+def clear(
+    supply: Offers,
+    demand: Offers,
+    stepped: bool = True,
+    max_elements: int = MAX_ELEMENTS,
+) -> tuple[np.ndarray, np.ndarray]:
+    if supply.n_rows == 0:
+        return np.empty(0), np.empty(0)
+    chunk_size = rows_per_chunk(supply, demand, max_elements)
+    quantities, prices = zip(
+        *[
+            _clear(
+                supply[start : start + chunk_size],
+                demand[start : start + chunk_size],
+                stepped,
+            )
+            for start in range(0, supply.n_rows, chunk_size)
+        ],
+        strict=True,
+    )
+    return np.concatenate(quantities), np.concatenate(prices)
+
+
+def _clear(
+    supply: Offers, demand: Offers, stepped: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    supply_xs, supply_ys = supply.aggregated()
+    demand_xs, demand_ys = demand.aggregated()
+    limits = np.minimum(supply_xs[:, -1], demand_xs[:, -1])
+    candidates = np.minimum(
+        np.sort(np.concatenate([supply_xs, demand_xs], axis=1), axis=1),
+        limits[:, np.newaxis],
+    )
+    surplus = _evaluated(demand_xs, demand_ys, candidates, stepped) - _evaluated(
+        supply_xs, supply_ys, candidates, stepped
+    )
+    rows = np.arange(len(candidates))
+    if stepped:
+        positive = surplus[:, 1:] > 0
+        stop = np.where(
+            positive.all(axis=1), positive.shape[1], positive.argmin(axis=1)
+        )
+        quantities = candidates[rows, stop]
+    else:
+        positive = surplus > 0
+        stop = np.where(
+            positive.all(axis=1), positive.shape[1] - 1, positive.argmin(axis=1)
+        )
+        before = np.maximum(stop - 1, 0)
+        surplus_before, surplus_at_stop = surplus[rows, before], surplus[rows, stop]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(
+                surplus_before > surplus_at_stop,
+                surplus_before / (surplus_before - surplus_at_stop),
+                0.0,
+            )
+        fraction = np.clip(np.nan_to_num(fraction), 0.0, 1.0)
+        quantities = candidates[rows, before] + fraction * (
+            candidates[rows, stop] - candidates[rows, before]
+        )
+
+    quantity_vals = quantities[:, np.newaxis]
+    lower = np.fmax(
+        _evaluated(supply_xs, supply_ys, quantity_vals, stepped),
+        _evaluated(demand_xs, demand_ys, quantity_vals, stepped, right=True),
+    )
+    upper = np.fmin(
+        _evaluated(demand_xs, demand_ys, quantity_vals, stepped),
+        _evaluated(supply_xs, supply_ys, quantity_vals, stepped, right=True),
+    )
+    prices = ((lower + upper) / 2)[:, 0]
+    return quantities, prices
+
+
+def _evaluated(
+    xs: np.ndarray,
+    ys: np.ndarray,
+    quantity_vals: np.ndarray,
+    stepped: bool,
+    right: bool = False,
+) -> np.ndarray:
+    compare = np.less_equal if right else np.less
+    n_points = xs.shape[1]
+    idx = compare(xs[:, np.newaxis, :], quantity_vals[:, :, np.newaxis]).sum(axis=2)
+    in_bounds = (idx < n_points) & (quantity_vals >= xs[:, :1])
+    idx = np.minimum(idx, n_points - 1)
+    vals = np.take_along_axis(ys, idx, axis=1)
+    if not stepped:
+        before = np.maximum(idx - 1, 0)
+        x0, x1 = (np.take_along_axis(xs, i, axis=1) for i in [before, idx])
+        y0 = np.take_along_axis(ys, before, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fraction = np.where(x1 > x0, (quantity_vals - x0) / (x1 - x0), 1.0)
+        vals = y0 + fraction * (vals - y0)
+    return np.where(in_bounds, vals, np.nan)
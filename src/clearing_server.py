@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import json
+from typing import Annotated, Any, Literal
+
+import numpy as np
+import pydantic
+
+from src.clearing import MAX_ELEMENTS, Offers, clear
+from src.drawing_utils import Point
+from src.supply_demand import DemandCurve, SupplyCurve, SupplyDemand
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_REQUEST_BYTES = 2**24
+
+type _Breakpoints = list[tuple[float, float]]
+
+
+@pydantic.dataclasses.dataclass
+class ClearingRequest:
+    supply_curves: Annotated[list[_Breakpoints], pydantic.Field(min_length=1)]
+    demand_curves: Annotated[list[_Breakpoints], pydantic.Field(min_length=1)]
+    stepped: bool = True
+    tolerance: Annotated[float, pydantic.Field(ge=0.0)] | None = None
+    id: int | str | None = None
+    type: Literal["clear"] = "clear"
+
+    @pydantic.field_validator("supply_curves", "demand_curves")
+    @classmethod
+    def _validate_curves(cls, curves: list[_Breakpoints]) -> list[_Breakpoints]:
+        for points in curves:
+            xs = [x for x, _ in points]
+            if len(xs) < 2:
+                raise ValueError("Curves need at least two points")
+            if np.any(np.diff(xs) < 0):
+                raise ValueError("Curve quantities must be non-decreasing")
+        return curves
+
+    def offers(self) -> tuple[Offers, Offers]:
+        if self.tolerance is not None:
+            supply_demand, _ = SupplyDemand(
+                *[
+                    [
+                        curve_type(
+                            [Point(x, y) for x, y in points], stepped=self.stepped
+                        )
+                        for points in curves
+                    ]
+                    for curve_type, curves in [
+                        (SupplyCurve, self.supply_curves),
+                        (DemandCurve, self.demand_curves),
+                    ]
+                ]
+            ).simplified(self.tolerance)
+            return (
+                Offers.from_curves(supply_demand.supply_curves),
+                Offers.from_curves(supply_demand.demand_curves),
+            )
+        return tuple(
+            Offers.combined(
+                [
+                    Offers.from_breakpoints(curve_type, *np.array(points).T)
+                    for points in curves
+                ]
+            )
+            for curve_type, curves in [
+                (SupplyCurve, self.supply_curves),
+                (DemandCurve, self.demand_curves),
+            ]
+        )
+
+
+@pydantic.dataclasses.dataclass
+class MetricsRequest:
+    id: int | str | None = None
+    type: Literal["metrics"] = "metrics"
+
+
+def _request_type(request: Any) -> str | None:
+    if isinstance(request, dict):
+        return request.get("type", "clear")
+    return getattr(request, "type", None)
+
+
+_REQUEST_ADAPTER = pydantic.TypeAdapter(
+    Annotated[
+        Annotated[ClearingRequest, pydantic.Tag("clear")]
+        | Annotated[MetricsRequest, pydantic.Tag("metrics")],
+        pydantic.Discriminator(_request_type),
+    ]
+)
+
+
+@dataclasses.dataclass
+class Metrics:
+    n_requests: int = 0
+    n_batches: int = 0
+    max_batch_size: int = 0
+    max_queue_depth: int = 0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.n_requests / self.n_batches if self.n_batches else 0.0
+
+    def to_dict(self) -> dict[str, float]:
+        return {**dataclasses.asdict(self), "mean_batch_size": self.mean_batch_size}
+
+
+def _stacked(offers: list[Offers]) -> Offers:
+    [curve_type] = {o.curve_type for o in offers}
+    n_segments = max(o.n_segments for o in offers)
+
+    def padded(array: np.ndarray, value: float) -> np.ndarray:
+        return np.pad(
+            array, ((0, 0), (0, n_segments - array.shape[1])), constant_values=value
+        )
+
+    return Offers(
+        curve_type,
+        np.concatenate([padded(o.widths, 0.0) for o in offers]),
+        np.concatenate([padded(o.prices, np.nan) for o in offers]),
+        np.concatenate([o.zero_quantity_prices for o in offers]),
+    )
+
+
+def _cleared(
+    requests: list[ClearingRequest], max_elements: int = MAX_ELEMENTS
+) -> list[tuple[float, float] | Exception]:
+    results: dict[int, tuple[float, float] | Exception] = {}
+    offers = {}
+    for i, request in enumerate(requests):
+        try:
+            offers[i] = request.offers()
+        except Exception as e:
+            results[i] = e
+    for stepped in {requests[i].stepped for i in offers}:
+        idxs = [i for i in offers if requests[i].stepped == stepped]
+        try:
+            quantities, prices = clear(
+                _stacked([offers[i][0] for i in idxs]),
+                _stacked([offers[i][1] for i in idxs]),
+                stepped,
+                max_elements,
+            )
+        except Exception as e:
+            for i in idxs:
+                results[i] = e
+            continue
+        for i, quantity, price in zip(idxs, quantities, prices, strict=True):
+            results[i] = (float(quantity), float(price))
+    return [results[i] for i in range(len(requests))]
+
+
+@dataclasses.dataclass
+class _Pending:
+    request: ClearingRequest
+    future: asyncio.Future[tuple[float, float]]
+
+
+@dataclasses.dataclass
+class MicroBatcher:
+    max_latency: float = 0.005
+    max_batch_size: int = 1024
+    max_elements: int = MAX_ELEMENTS
+
+    def __post_init__(self) -> None:
+        self.metrics = Metrics()
+        self._queue: asyncio.Queue[_Pending] = asyncio.Queue()
+
+    async def clear(self, request: ClearingRequest) -> tuple[float, float]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(request, future))
+        self.metrics.max_queue_depth = max(
+            self.metrics.max_queue_depth, self.queue_depth
+        )
+        return await future
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(
+                        await asyncio.wait_for(
+                            self._queue.get(), timeout=max(0.0, deadline - loop.time())
+                        )
+                    )
+                except TimeoutError:
+                    break
+            self.metrics.n_requests += len(batch)
+            self.metrics.n_batches += 1
+            self.metrics.max_batch_size = max(self.metrics.max_batch_size, len(batch))
+            results = await asyncio.to_thread(
+                _cleared, [p.request for p in batch], self.max_elements
+            )
+            for p, result in zip(batch, results, strict=True):
+                if p.future.done():
+                    continue
+                if isinstance(result, Exception):
+                    p.future.set_exception(result)
+                else:
+                    p.future.set_result(result)
+
+
+async def _respond(
+    batcher: MicroBatcher, line: bytes, writer: asyncio.StreamWriter
+) -> None:
+    request_id = None
+    try:
+        raw_request = json.loads(line)
+        if isinstance(raw_request, dict) and isinstance(
+            raw_request.get("id"), int | str
+        ):
+            request_id = raw_request["id"]
+        request = _REQUEST_ADAPTER.validate_python(raw_request)
+    except ValueError as e:
+        response = {"id": request_id, "error": str(e)}
+    else:
+        match request:
+            case ClearingRequest():
+                try:
+                    quantity, price = await batcher.clear(request)
+                except Exception as e:
+                    response = {"id": request.id, "error": str(e)}
+                else:
+                    response = {"id": request.id, "quantity": quantity, "price": price}
+            case MetricsRequest():
+                response = {
+                    "id": request.id,
+                    **batcher.metrics.to_dict(),
+                    "queue_depth": batcher.queue_depth,
+                }
+    await _write(writer, response)
+
+
+async def _write(writer: asyncio.StreamWriter, response: dict[str, Any]) -> None:
+    if writer.is_closing():
+        return
+    writer.write(json.dumps(response).encode() + b"\n")
+    with contextlib.suppress(ConnectionError):
+        await writer.drain()
+
+
+async def _readline(reader: asyncio.StreamReader, max_request_bytes: int) -> bytes:
+    try:
+        return await reader.readuntil(b"\n")
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b"\n")
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+        else:
+            raise ValueError(
+                f"Request is longer than --max-request-bytes={max_request_bytes}"
+            )
+
+
+async def serve(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    batcher: MicroBatcher | None = None,
+    max_request_bytes: int = DEFAULT_MAX_REQUEST_BYTES,
+) -> None:
+    if batcher is None:
+        batcher = MicroBatcher()
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await _readline(reader, max_request_bytes)
+                except ValueError as e:
+                    await _write(writer, {"id": None, "error": str(e)})
+                    continue
+                if not line:
+                    break
+                task = asyncio.create_task(_respond(batcher, line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    server = await asyncio.start_server(handle, host, port, limit=max_request_bytes)
+    async with server, asyncio.TaskGroup() as task_group:
+        task_group.create_task(batcher.run())
+        await server.serve_forever()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Serve market clearing over newline-delimited JSON, "
+            "clearing concurrent requests in micro-batches"
+        )
+    )
+    parser.add_argument(
+        "--host", default=DEFAULT_HOST, help=f"Host (default: {DEFAULT_HOST})"
+    )
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})"
+    )
+    parser.add_argument(
+        "--max-latency",
+        type=float,
+        default=0.005,
+        help="Seconds to wait for a micro-batch to fill (default: 0.005)",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=1024,
+        help="Maximum number of requests per micro-batch (default: 1024)",
+    )
+
+    parser.add_argument(
+        "--max-request-bytes",
+        type=int,
+        default=DEFAULT_MAX_REQUEST_BYTES,
+        help=(
+            "Maximum length of one request line in bytes "
+            f"(default: {DEFAULT_MAX_REQUEST_BYTES})"
+        ),
+    )
+
+    args = parser.parse_args()
+
+    asyncio.run(
+        serve(
+            args.host,
+            args.port,
+            MicroBatcher(
+                max_latency=args.max_latency, max_batch_size=args.max_batch_size
+            ),
+            args.max_request_bytes,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import dataclasses
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+from src.clearing import MAX_ELEMENTS, Offers, clear, rows_per_chunk
+from src.supply_demand import Simplification, SupplyDemand
+
+type Sampler = Callable[[np.random.Generator, int], np.ndarray]
+
+
+@dataclasses.dataclass
+class Perturbation:
+    price_offset: Sampler | None = None
+    quantity_factor: Sampler | None = None
+
+    def applied(self, offers: Offers, rng: np.random.Generator) -> Offers:
+        return offers.perturbed(
+            price_offsets=(
+                self.price_offset(rng, offers.n_rows)
+                if self.price_offset is not None
+                else np.zeros(offers.n_rows)
+            ),
+            quantity_factors=(
+                self.quantity_factor(rng, offers.n_rows)
+                if self.quantity_factor is not None
+                else np.ones(offers.n_rows)
+            ),
+        )
+
+
+@dataclasses.dataclass
+class MonteCarloResult:
+    quantities: np.ndarray
+    prices: np.ndarray
+    simplification: Simplification | None = None
+
+    def quantiles(self, q: tuple[float, ...] = (0.05, 0.5, 0.95)) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "quantity": np.nanquantile(self.quantities, q),
+                "price": np.nanquantile(self.prices, q),
+            },
+            index=pd.Index(q, name="quantile"),
+        )
+
+
+def monte_carlo(
+    supply_demand: SupplyDemand,
+    supply: Perturbation = Perturbation(),
+    demand: Perturbation = Perturbation(),
+    n_draws: int = 10_000,
+    seed: int | None = None,
+    max_elements: int = MAX_ELEMENTS,
+    tolerance: float | None = None,
+) -> MonteCarloResult:
+    simplification = None
+    if tolerance is not None:
+        supply_demand, simplification = supply_demand.simplified(tolerance)
+    rng = np.random.default_rng(seed)
+    [stepped] = {c.stepped for c in supply_demand.curves}
+    chunk_size = rows_per_chunk(
+        Offers.from_curves(supply_demand.supply_curves),
+        Offers.from_curves(supply_demand.demand_curves),
+        max_elements,
+    )
+    quantities = np.empty(n_draws)
+    prices = np.empty(n_draws)
+    for start in range(0, n_draws, chunk_size):
+        n_rows = min(chunk_size, n_draws - start)
+        supply_offers, demand_offers = (
+            Offers.combined(
+                [
+                    perturbation.applied(Offers.from_curve(c, n_rows), rng)
+                    for c in curves
+                ]
+            )
+            for perturbation, curves in [
+                (supply, supply_demand.supply_curves),
+                (demand, supply_demand.demand_curves),
+            ]
+        )
+        (
+            quantities[start : start + n_rows],
+            prices[start : start + n_rows],
+        ) = clear(supply_offers, demand_offers, stepped, max_elements)
+    return MonteCarloResult(quantities, prices, simplification)
@@ -1,12 +1,12 @@
 from __future__ import annotations
 
 import dataclasses
-from copy import deepcopy
-from typing import Self
+from functools import cached_property
+from typing import Any, Self
 
 import numpy as np
 import pandas as pd
-from scipy.interpolate import interp1d
+from numpy.typing import ArrayLike
 
 from src.drawing_utils import Point
 from src.plotting_utils import configure_matplotlib
@@ -17,69 +17,234 @@ DX = 1e-3
 DECIMALS = 10
 
 
+def quantity_range(
+    start: float, stop: float, quantity_scale: int | None = None
+) -> np.ndarray:
+    if quantity_scale is None:
+        return np.arange(start, stop + DX, DX).round(DECIMALS)
+    return (
+        _fixed_quantity_range(
+            round(start * quantity_scale), round(stop * quantity_scale), quantity_scale
+        )
+        / quantity_scale
+    )
+
+
+def _fixed_quantity_range(start: int, stop: int, quantity_scale: int) -> np.ndarray:
+    return np.arange(start, stop + 1, _fixed_quantity_step(quantity_scale))
+
+
+def _fixed_quantity_step(quantity_scale: int) -> int:
+    return max(1, round(DX * quantity_scale))
+
+
+def quantity_index(quantity_vals: np.ndarray, quantity: float) -> int:
+    idx = int(np.abs(quantity_vals - quantity).argmin())
+    if round(quantity_vals[idx] - quantity, DECIMALS) != 0:
+        raise ValueError(f"{quantity} is not in quantity_vals")
+    return idx
+
+
 class Colors:
     SUPPLY = "#1565C0"
     DEMAND = "#EF6C00"
     WELFARE = "#2E7D32"
 
 
+@dataclasses.dataclass
+class Interpolator:
+    xs: np.ndarray
+    ys: np.ndarray
+    stepped: bool = False
+
+    def __post_init__(self) -> None:
+        self._ys = np.append(self.ys, np.nan)
+        widths = np.diff(self.xs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._slopes = np.where(widths > 0, np.diff(self.ys) / widths, 0.0)
+        self._bounds = (self.xs[0], self.xs[-1])
+
+    def __call__(self, x: ArrayLike) -> np.ndarray:
+        x = np.asarray(x)
+        if self.stepped:
+            vals = self._ys[np.searchsorted(self.xs, x, side="left")]
+        else:
+            idx = np.searchsorted(self.xs, x, side="right").clip(1, len(self.xs) - 1)
+            vals = np.where(
+                self.xs[idx] > self.xs[idx - 1],
+                self.ys[idx - 1] + self._slopes[idx - 1] * (x - self.xs[idx - 1]),
+                self.ys[idx],
+            )
+        return np.where((x < self._bounds[0]) | (x > self._bounds[1]), np.nan, vals)
+
+
+@dataclasses.dataclass
+class Simplification:
+    n_points: int
+    n_simplified_points: int
+
+    @classmethod
+    def between(cls, curves: list[Curve], simplified_curves: list[Curve]) -> Self:
+        return cls(
+            sum([len(c.points) for c in curves]),
+            sum([len(c.points) for c in simplified_curves]),
+        )
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.n_simplified_points / self.n_points
+
+
 @dataclasses.dataclass
 class Curve:
-    points: list[Point]
+    points: tuple[Point, ...]
     name: str
     integral_name: str
     integral_symbol: str
     color: str
     fmt: str = "-"
     stepped: bool = True
+    quantity_scale: int | None = None
 
     def __post_init__(self) -> None:
         self.integral_name = self.integral_name.replace("{name}", self.name)
         self.integral_symbol = self.integral_symbol.replace("{name}", self.name)
+        if self.quantity_scale is not None and (
+            self.quantity_scale < 1
+            or (
+                DX * self.quantity_scale > 1
+                and not round(DX * self.quantity_scale, DECIMALS).is_integer()
+            )
+        ):
+            raise ValueError(
+                f"quantity_scale must be a positive integer that divides evenly "
+                f"into steps of DX={DX}, got {self.quantity_scale}"
+            )
 
-    @property
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "points":
+            value = tuple(value)
+        super().__setattr__(name, value)
+        if name in ["points", "stepped", "quantity_scale"]:
+            for cached in ["xs", "ys", "func", "integral"]:
+                self.__dict__.pop(cached, None)
+        if name in ["points", "quantity_scale"]:
+            super().__setattr__("fixed_xs", self._fixed_xs())
+
+    def _fixed_xs(self) -> np.ndarray | None:
+        if self.quantity_scale is None:
+            return None
+        scaled_xs = np.array([p.x for p in self.points]) * self.quantity_scale
+        fixed_xs = np.rint(scaled_xs)
+        if np.any(scaled_xs.round(DECIMALS) != fixed_xs):
+            raise ValueError(
+                f"Quantities must be whole multiples of 1/{self.quantity_scale}"
+            )
+        return fixed_xs.astype(np.int64)
+
+    @cached_property
     def xs(self) -> np.ndarray:
         return np.array([p.x for p in self.points])
 
-    @property
+    @cached_property
     def ys(self) -> np.ndarray:
         return np.array([p.y for p in self.points])
 
     def to_series(self) -> pd.Series:
         return pd.Series(self.ys, index=self.xs)
 
-    @property
-    def func(self) -> interp1d:
-        return interp1d(
-            self.xs,
-            self.ys,
-            kind=("next" if self.stepped else "linear"),
-            bounds_error=False,
-        )
+    @cached_property
+    def func(self) -> Interpolator:
+        return Interpolator(self.xs, self.ys, self.stepped)
 
     @property
     def upsampled(self) -> Self:
-        copy = deepcopy(self)
-        quantity_vals = np.arange(self.xs.min(), self.xs.max() + DX, DX).round(DECIMALS)
-        copy.points = [
-            Point(x, y)
-            for (x, y) in zip(quantity_vals, copy.func(quantity_vals), strict=True)
-        ]
-        return copy
+        quantity_vals = quantity_range(
+            self.xs.min(), self.xs.max(), self.quantity_scale
+        )
+        return dataclasses.replace(
+            self,
+            points=[
+                Point(x, y)
+                for (x, y) in zip(quantity_vals, self.func(quantity_vals), strict=True)
+            ],
+        )
 
-    @property
-    def integral(self) -> interp1d:
+    def simplified(self, tolerance: float = 0.0) -> Self:
+        return dataclasses.replace(
+            self,
+            points=(
+                self._simplified_steps(tolerance)
+                if self.stepped
+                else self._simplified_segments(tolerance)
+            ),
+        )
+
+    def _simplified_steps(self, tolerance: float) -> list[Point]:
+        points = [self.points[0]]
+        run_min = run_max = self.points[0].y
+        for point in self.points[1:]:
+            if point.x == points[-1].x:
+                continue
+            if len(points) > 1 and (
+                round(max(run_max, point.y) - min(run_min, point.y), DECIMALS)
+                <= 2 * tolerance
+            ):
+                run_min, run_max = min(run_min, point.y), max(run_max, point.y)
+                points[-1] = Point(point.x, (run_min + run_max) / 2)
+            else:
+                run_min = run_max = point.y
+                points.append(point)
+        return points
+
+    def _simplified_segments(self, tolerance: float) -> list[Point]:
+        xs, ys = self.xs, self.ys
+        idxs = [0]
+        for end in range(2, len(xs)):
+            start = idxs[-1]
+            if xs[end] > xs[start]:
+                interpolated_ys = ys[start] + (ys[end] - ys[start]) * (
+                    xs[start + 1 : end] - xs[start]
+                ) / (xs[end] - xs[start])
+                errors = np.abs(interpolated_ys - ys[start + 1 : end]).round(DECIMALS)
+                if np.all(errors <= tolerance):
+                    continue
+            idxs.append(end - 1)
+        if len(xs) > 1:
+            idxs.append(len(xs) - 1)
+        return [self.points[i] for i in idxs]
+
+    def _fixed_upsampled(self) -> tuple[np.ndarray, np.ndarray]:
+        quantity_vals = _fixed_quantity_range(
+            self.fixed_xs[0], self.fixed_xs[-1], self.quantity_scale
+        )
+        return quantity_vals, Interpolator(self.fixed_xs, self.ys, self.stepped)(
+            quantity_vals
+        )
+
+    @cached_property
+    def integral(self) -> Interpolator:
+        if self.quantity_scale is not None:
+            quantity_vals, price_vals = self._fixed_upsampled()
+            areas = price_vals[1:] if self.stepped else price_vals[:-1]
+            return Interpolator(
+                quantity_vals / self.quantity_scale,
+                np.array([0.0, *areas.cumsum()])
+                * _fixed_quantity_step(self.quantity_scale)
+                / self.quantity_scale,
+            )
         upsampled = self.upsampled.to_series()
         if self.stepped:
             upsampled = upsampled.shift(-1)
         y_vals = np.array([0.0, *upsampled.iloc[:-1].cumsum().to_numpy()]) * DX
-        return interp1d(upsampled.index, y_vals, bounds_error=False)
+        return Interpolator(upsampled.index.to_numpy(), y_vals)
 
     @staticmethod
     def aggregate[C: SupplyCurve | DemandCurve](
         curves: list[C], mask: str | None = None, individual_quantities: bool = False
     ) -> C:
         [curve_type] = {type(c) for c in curves}
+        [quantity_scale] = {c.quantity_scale for c in curves}
         curve_dfs = []
         zero_quantity_prices = []
         for curve in curves:
@@ -91,6 +256,8 @@ class Curve:
             )
             curve_df["delta_quantity"] = (
                 curve_df["individual_quantity"].diff().round(DECIMALS)
+                if quantity_scale is None
+                else np.diff(curve.fixed_xs, prepend=curve.fixed_xs[:1])
             )
             curve_dfs.append(curve_df.iloc[1:])
             zero_quantity_prices.append(curve_df.iloc[0]["price"])
@@ -98,8 +265,11 @@ class Curve:
         composite_df = composite_df.sort_values(
             by="price", ascending=(curve_type is SupplyCurve), kind="stable"
         )
+        total_quantities = composite_df["delta_quantity"].cumsum()
         composite_df["total_quantity"] = (
-            composite_df["delta_quantity"].cumsum().round(DECIMALS)
+            total_quantities.round(DECIMALS)
+            if quantity_scale is None
+            else total_quantities / quantity_scale
         )
         if mask is not None:
             composite_df.loc[
@@ -107,7 +277,7 @@ class Curve:
             ] = 0.0
         points = [
             Point(
-                round(row["total_quantity"], DECIMALS),
+                row["total_quantity"],
                 row["individual_quantity"] if individual_quantities else row["price"],
             )
             for _, row in composite_df.iterrows()
@@ -138,8 +308,37 @@ class Curve:
             color=(curve.color if mask else curve_type.color),
             fmt=(curve.fmt if mask else curve_type.fmt),
             stepped=stepped,
+            quantity_scale=quantity_scale,
         )
 
+    @staticmethod
+    def fixed_dispatch(
+        curves: list[SupplyCurve] | list[DemandCurve], mask: str, total_quantity: float
+    ) -> float:
+        [curve_type] = {type(c) for c in curves}
+        [quantity_scale] = {c.quantity_scale for c in curves}
+        upsampled = [c._fixed_upsampled() for c in curves]
+        individual_quantities = np.concatenate(
+            [
+                quantity_vals[1:]
+                if c.name == mask
+                else np.zeros_like(quantity_vals[1:])
+                for c, (quantity_vals, _) in zip(curves, upsampled, strict=True)
+            ]
+        )
+        widths = np.concatenate(
+            [np.diff(quantity_vals) for quantity_vals, _ in upsampled]
+        )
+        prices = np.concatenate([price_vals[1:] for _, price_vals in upsampled])
+        order = np.argsort(
+            prices if curve_type is SupplyCurve else -prices, kind="stable"
+        )
+        total_quantities = widths[order].cumsum()
+        dispatched = individual_quantities[order][
+            total_quantities <= round(total_quantity * quantity_scale)
+        ]
+        return float(dispatched.max(initial=0) / quantity_scale)
+
 
 @dataclasses.dataclass
 class SupplyCurve(Curve):
@@ -171,45 +370,153 @@ class SupplyDemand:
         [curve] = [c for c in self.curves if c.name == name]
         return curve
 
-    def cost(self, mask: str | None = None) -> interp1d:
-        return Curve.aggregate(self.supply_curves, mask).integral
+    @property
+    def quantity_scale(self) -> int | None:
+        [quantity_scale] = {c.quantity_scale for c in self.curves}
+        return quantity_scale
 
-    def utility(self, mask: str | None = None) -> interp1d:
-        return Curve.aggregate(self.demand_curves, mask).integral
+    def simplified(self, tolerance: float = 0.0) -> tuple[Self, Simplification]:
+        simplified = dataclasses.replace(
+            self,
+            supply_curves=self._simplified_curves(self.supply_curves, tolerance),
+            demand_curves=self._simplified_curves(self.demand_curves, tolerance),
+        )
+        return simplified, Simplification.between(self.curves, simplified.curves)
+
+    @staticmethod
+    def _simplified_curves[C: SupplyCurve | DemandCurve](
+        curves: list[C], tolerance: float
+    ) -> list[C]:
+        # Aggregation orders linear segments by their end price, so merging
+        # them would reorder them against the other curves on the same side.
+        if len(curves) > 1 and not all([c.stepped for c in curves]):
+            return curves
+        return [c.simplified(tolerance) for c in curves]
 
-    def welfare(self, mask: str | None = None) -> callable[np.array, np.array]:
-        return lambda quantity: self.utility(mask)(quantity) - self.cost(mask)(quantity)
+    def cost(self, mask: str | None = None) -> Interpolator:
+        return self.cleared().cost(mask)
+
+    def utility(self, mask: str | None = None) -> Interpolator:
+        return self.cleared().utility(mask)
+
+    def welfare(self) -> callable[np.array, np.array]:
+        return self.cleared().welfare()
 
     def equilibrium_quantity(self, mask: str | None = None) -> float:
-        quantity_vals = np.arange(0.0, self.max_total_quantity + DX, DX).round(DECIMALS)
-        welfare_vals = self.welfare()(quantity_vals)
-        idxmax = np.nanargmax(welfare_vals)
-        equilibrium_total_quantity = quantity_vals[idxmax]
-        if mask is None:
-            return equilibrium_total_quantity
-        else:
-            [curve_type] = {type(c) for c in self.curves if c.name == mask}
-            curves = [c for c in self.curves if isinstance(c, curve_type)]
-            composite_curve = Curve.aggregate(
-                [c.upsampled for c in curves], mask, individual_quantities=True
-            )
-            equilibrium_individual_quantity = max(
-                [
-                    p.y
-                    for p in composite_curve.points
-                    if p.x <= equilibrium_total_quantity
-                ]
-            )
-            return equilibrium_individual_quantity
+        return self.cleared().equilibrium_quantity(mask)
 
     @property
     def max_total_quantity(self) -> float:
-        return sum([c.xs.max() for c in self.supply_curves])
+        if self.quantity_scale is None:
+            return sum([c.xs.max() for c in self.supply_curves])
+        return (
+            sum([int(c.fixed_xs.max()) for c in self.supply_curves])
+            / self.quantity_scale
+        )
+
+    @property
+    def equilibrium(self) -> Point | None:
+        return self.cleared().equilibrium
+
+    def cleared(self, tolerance: float | None = None) -> ClearingResult:
+        if tolerance is None:
+            return ClearingResult(self)
+        return ClearingResult(*self.simplified(tolerance))
+
+
+@dataclasses.dataclass
+class ClearingResult:
+    supply_demand: SupplyDemand
+    simplification: Simplification | None = None
+
+    def __post_init__(self) -> None:
+        self._masked_curves: dict[str, SupplyCurve | DemandCurve] = {}
+        self._equilibrium_quantities: dict[str | None, float] = {}
+
+    @cached_property
+    def supply_curve(self) -> SupplyCurve:
+        return Curve.aggregate(self.supply_demand.supply_curves)
+
+    @cached_property
+    def demand_curve(self) -> DemandCurve:
+        return Curve.aggregate(self.supply_demand.demand_curves)
+
+    def total_curve[C: SupplyCurve | DemandCurve](self, curve_type: type[C]) -> C:
+        return {SupplyCurve: self.supply_curve, DemandCurve: self.demand_curve}[
+            curve_type
+        ]
+
+    def masked_curve[C: SupplyCurve | DemandCurve](
+        self, mask: str, curve_type: type[C]
+    ) -> C:
+        curves = self._curves(curve_type)
+        if mask not in [c.name for c in curves]:
+            raise ValueError(f"{mask!r} is not the name of a {curve_type.__name__}")
+        if mask not in self._masked_curves:
+            self._masked_curves[mask] = Curve.aggregate(curves, mask)
+        return self._masked_curves[mask]
+
+    def masked_curves[C: SupplyCurve | DemandCurve](
+        self, curve_type: type[C]
+    ) -> list[C]:
+        return [self.masked_curve(c.name, curve_type) for c in self._curves(curve_type)]
+
+    def _curves[C: SupplyCurve | DemandCurve](self, curve_type: type[C]) -> list[C]:
+        return [c for c in self.supply_demand.curves if isinstance(c, curve_type)]
+
+    def cost(self, mask: str | None = None) -> Interpolator:
+        return (
+            self.masked_curve(mask, SupplyCurve)
+            if mask is not None
+            else self.supply_curve
+        ).integral
+
+    def utility(self, mask: str | None = None) -> Interpolator:
+        return (
+            self.masked_curve(mask, DemandCurve)
+            if mask is not None
+            else self.demand_curve
+        ).integral
+
+    def welfare(self) -> callable[np.array, np.array]:
+        return lambda quantity: self.utility()(quantity) - self.cost()(quantity)
+
+    def equilibrium_quantity(self, mask: str | None = None) -> float:
+        if mask not in self._equilibrium_quantities:
+            self._equilibrium_quantities[mask] = (
+                self._equilibrium_total_quantity()
+                if mask is None
+                else self._equilibrium_individual_quantity(mask)
+            )
+        return self._equilibrium_quantities[mask]
+
+    def _equilibrium_total_quantity(self) -> float:
+        quantity_vals = quantity_range(
+            0.0,
+            self.supply_demand.max_total_quantity,
+            self.supply_demand.quantity_scale,
+        )
+        welfare_vals = self.welfare()(quantity_vals)
+        idxmax = np.nanargmax(welfare_vals)
+        return quantity_vals[idxmax]
+
+    def _equilibrium_individual_quantity(self, mask: str) -> float:
+        [curve_type] = {type(c) for c in self.supply_demand.curves if c.name == mask}
+        curves = self._curves(curve_type)
+        equilibrium_total_quantity = self.equilibrium_quantity()
+        if self.supply_demand.quantity_scale is not None:
+            return Curve.fixed_dispatch(curves, mask, equilibrium_total_quantity)
+        composite_curve = Curve.aggregate(
+            [c.upsampled for c in curves], mask, individual_quantities=True
+        )
+        return max(
+            [p.y for p in composite_curve.points if p.x <= equilibrium_total_quantity]
+        )
 
     @property
     def equilibrium(self) -> Point | None:
         return (
-            Point(self.equilibrium_quantity(), self.equilibrium_price)
-            if self.equilibrium_price is not None
+            Point(self.equilibrium_quantity(), self.supply_demand.equilibrium_price)
+            if self.supply_demand.equilibrium_price is not None
             else None
         )
@@ -1,22 +1,34 @@
 import dataclasses
+from collections.abc import Iterator
+from contextlib import contextmanager
 from enum import Enum
-from typing import assert_never
+from pathlib import Path
+from typing import Any, assert_never
 
 import numpy as np
+from matplotlib.artist import Artist
 from matplotlib.axes import Axes
 
 from src.drawing_utils import Arrow, Point
 from src.plotting_utils import rm
 from src.supply_demand import (
-    DX,
+    ClearingResult,
     Colors,
     Curve,
     DemandCurve,
     SupplyCurve,
     SupplyDemand,
+    quantity_index,
+    quantity_range,
 )
 
 
+def _cleared(supply_demand: SupplyDemand | ClearingResult) -> ClearingResult:
+    if isinstance(supply_demand, ClearingResult):
+        return supply_demand
+    return supply_demand.cleared()
+
+
 class LegendLoc(Enum):
     LOWER_LEFT = "lower left"
     UPPER_RIGHT = "upper right"
@@ -35,7 +47,7 @@ class _BasePlotter:
     yaxis_label: str = dataclasses.field(init=False)
 
     def __post_init__(self) -> None:
-        self.x_vals = np.arange(self.xlim[0], self.xlim[1] + DX, DX)
+        self.x_vals = quantity_range(*self.xlim)
 
         self.ax.spines[:].set_visible(False)
         self.ax.set_xlim(self.xlim[0] - 0.3, self.xlim[1] * 1.1)
@@ -57,9 +69,11 @@ class _BasePlotter:
 
     def legend(self, loc: LegendLoc = LegendLoc.LOWER_LEFT) -> None:
         fontsize = 10
+        handles = [h for h in self.ax.get_legend_handles_labels()[0] if h.get_visible()]
         match loc:
             case LegendLoc.UPPER_RIGHT:
                 self.ax.legend(
+                    handles=handles,
                     loc=loc.value,
                     bbox_to_anchor=(1.05, 1.1),
                     fontsize=fontsize,
@@ -67,6 +81,7 @@ class _BasePlotter:
                 )
             case LegendLoc.LOWER_LEFT:
                 self.ax.legend(
+                    handles=handles,
                     loc=loc.value,
                     bbox_to_anchor=(0.95, 0.5),
                     fontsize=fontsize,
@@ -113,13 +128,14 @@ class SupplyDemandPlotter(_BasePlotter):
 
     def plot_all(
         self,
-        supply_demand: SupplyDemand,
+        supply_demand: SupplyDemand | ClearingResult,
         legend_loc: LegendLoc | None = LegendLoc.DEFAULT,
     ) -> None:
-        equilibrium = supply_demand.equilibrium
+        clearing = _cleared(supply_demand)
+        equilibrium = clearing.equilibrium
         equilibrium_quantity = equilibrium.x if equilibrium is not None else None
-        for curves in [supply_demand.supply_curves, supply_demand.demand_curves]:
-            self.plot(Curve.aggregate(curves), equilibrium_quantity)
+        for curve in [clearing.supply_curve, clearing.demand_curve]:
+            self.plot(curve, equilibrium_quantity)
         if equilibrium is not None:
             equilibrium.drawn(self.ax)
         if legend_loc is not None:
@@ -140,7 +156,7 @@ class CostUtilityPlotter(_BasePlotter):
     ) -> None:
         if equilibrium_quantity is not None:
             print(
-                f"{curve_or_type.integral_name}: {cost_or_utility_vals[list(quantity_vals).index(equilibrium_quantity)]:.3f}"
+                f"{curve_or_type.integral_name}: {cost_or_utility_vals[quantity_index(quantity_vals, equilibrium_quantity)]:.3f}"
             )
         if label is None:
             label = f"{curve_or_type.integral_name}, {curve_or_type.integral_symbol}"
@@ -173,7 +189,7 @@ class CostUtilityPlotter(_BasePlotter):
         )
         if equilibrium_quantity is not None:
             optimal_welfare = welfare_vals[
-                list(quantity_vals).index(equilibrium_quantity)
+                quantity_index(quantity_vals, equilibrium_quantity)
             ]
             print(f"W(Q_opt) = {optimal_welfare:.3f}")
             optimum = Point(equilibrium_quantity, optimal_welfare)
@@ -183,15 +199,15 @@ class CostUtilityPlotter(_BasePlotter):
 
     def plot_welfare(
         self,
-        supply_demand: SupplyDemand,
+        supply_demand: SupplyDemand | ClearingResult,
         legend_loc: LegendLoc | None = LegendLoc.DEFAULT,
     ) -> None:
-        welfare = supply_demand.welfare()
-        welfare_vals = welfare(self.x_vals)
+        clearing = _cleared(supply_demand)
+        welfare_vals = clearing.welfare()(self.x_vals)
         self.plot_welfare_vals(
             self.x_vals,
             welfare_vals,
-            supply_demand.equilibrium_quantity(),
+            clearing.equilibrium_quantity(),
             legend_loc,
         )
 
@@ -202,22 +218,90 @@ class CostUtilityPlotter(_BasePlotter):
         equilibrium_quantity: float | None = None,
         legend_loc: LegendLoc | None = LegendLoc.DEFAULT,
     ) -> None:
-        for curve in curves:
-            self.plot_cost_or_utility(
-                Curve.aggregate(curves, mask=curve.name), equilibrium_quantity
-            )
-        if total:
-            self.plot_cost_or_utility(Curve.aggregate(curves), equilibrium_quantity)
+        self._plot_multiple(
+            [Curve.aggregate(curves, mask=curve.name) for curve in curves],
+            Curve.aggregate(curves) if total else None,
+            equilibrium_quantity,
+            legend_loc,
+        )
+
+    def plot_cleared(
+        self,
+        clearing: ClearingResult,
+        curve_type: type[SupplyCurve | DemandCurve],
+        total: bool = False,
+        equilibrium_quantity: float | None = None,
+        legend_loc: LegendLoc | None = LegendLoc.DEFAULT,
+    ) -> None:
+        self._plot_multiple(
+            clearing.masked_curves(curve_type),
+            clearing.total_curve(curve_type) if total else None,
+            equilibrium_quantity,
+            legend_loc,
+        )
+
+    def _plot_multiple(
+        self,
+        masked_curves: list[SupplyCurve | DemandCurve],
+        total_curve: SupplyCurve | DemandCurve | None,
+        equilibrium_quantity: float | None,
+        legend_loc: LegendLoc | None,
+    ) -> None:
+        for curve in masked_curves:
+            self.plot_cost_or_utility(curve, equilibrium_quantity)
+        if total_curve is not None:
+            self.plot_cost_or_utility(total_curve, equilibrium_quantity)
         if legend_loc is not None:
             self.legend(legend_loc)
 
     def plot_all(
         self,
-        supply_demand: SupplyDemand,
+        supply_demand: SupplyDemand | ClearingResult,
         total: bool = False,
         equilibrium_quantity: float | None = None,
         legend_loc: LegendLoc | None = LegendLoc.DEFAULT,
     ) -> None:
-        for curves in [supply_demand.supply_curves, supply_demand.demand_curves]:
-            self.plot_multiple(curves, total, equilibrium_quantity, legend_loc)
-        self.plot_welfare(supply_demand, legend_loc)
+        clearing = _cleared(supply_demand)
+        for curve_type in [SupplyCurve, DemandCurve]:
+            self.plot_cleared(
+                clearing, curve_type, total, equilibrium_quantity, legend_loc
+            )
+        self.plot_welfare(clearing, legend_loc)
+
+
+@dataclasses.dataclass
+class FrameSequence:
+    plotter: _BasePlotter
+
+    def __post_init__(self) -> None:
+        self._layers: dict[str, list[Artist]] = {}
+        subplotpars = self.plotter.ax.figure.subplotpars
+        self._subplotpars = {
+            k: getattr(subplotpars, k)
+            for k in ["left", "bottom", "right", "top", "wspace", "hspace"]
+        }
+
+    @contextmanager
+    def layer(self, name: str) -> Iterator[None]:
+        existing_artists = set(self.plotter.ax.get_children())
+        yield
+        self._layers[name] = [
+            a for a in self.plotter.ax.get_children() if a not in existing_artists
+        ]
+
+    def save(
+        self,
+        path: Path,
+        layers: list[str],
+        legend_loc: LegendLoc | None = None,
+        **savefig_kwargs: Any,
+    ) -> None:
+        for name, artists in self._layers.items():
+            for artist in artists:
+                artist.set_visible(name in layers)
+        if self.plotter.ax.legend_ is not None:
+            self.plotter.ax.legend_.remove()
+        if legend_loc is not None:
+            self.plotter.legend(legend_loc)
+        self.plotter.ax.figure.subplots_adjust(**self._subplotpars)
+        self.plotter.ax.figure.savefig(path, **savefig_kwargs)